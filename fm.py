@@ -15,9 +15,11 @@ and methods to create, change, save, and open patches.
 
 import math
 import json
-from jsonschema import validate
-import os
-import tempfile
+from jsonschema.validators import validator_for
+import io
+import subprocess
+from collections import OrderedDict
+from itertools import accumulate
 import numpy as np
 import soundfile as sf
 
@@ -26,7 +28,15 @@ FS = 44100  # sample rate
 PLOT_LIM = FS//100  # for output plots, excluding envelope
 SECONDS = 1
 T = np.linspace(0, SECONDS, math.ceil(FS*SECONDS))
+TWO_PI_T = 2*np.pi*T  # phase of a 1 Hz sine at each time in T
+N_SAMPLES = np.size(T)
+# envelope of operators and outputs without an envelope,
+# shared between them all, so it is read-only
+NO_ENVELOPE = np.ones(N_SAMPLES)
+NO_ENVELOPE.setflags(write=False)
 NOTE = 440  # tuning frequency
+CHAIN_CACHE_SIZE = 8  # number of previous outputs remembered per chain
+ENVELOPE_CACHE_SIZE = 8  # number of output envelopes remembered per synth
 
 # this makes a sound vaguely similar to dx7 epiano
 default_patch = {"freqs": [[14.0, 1.0], [1.0, 1.0], [1.0, 1.0]],
@@ -38,6 +48,60 @@ default_patch = {"freqs": [[14.0, 1.0], [1.0, 1.0], [1.0, 1.0]],
                  "feedback": [[0, 0], [0, 0], [0, 0]]
                  }
 
+# TODO: no. arguments based on algorithm
+PATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "algorithm": {
+            "type": "array",
+            "items": {"type": "number"}
+        },
+        "mod_0": {
+            "type": "array",
+            "items": {"type": "number"}
+        },
+        "volume": {
+            "type": "array",
+            "items": {"type": "number"}
+        },
+        "freqs": {
+            "type": "array",
+            "items": {"type": "array",
+                      "items": {"type": "number"}
+                      }
+        },
+        "mod_indices": {
+            "type": "array",
+            "items": {"type": "array",
+                      "items": {"type": "number"}
+                      }
+        },
+        "feedback": {
+            "type": "array",
+            "items": {"type": "array",
+                      "items": {"type": "number"}
+                      }
+        },
+        "output_env": {
+            "type": "array",
+            "items": {"type": ["number", "array"]}
+        },
+        "envs": {
+            "type": "array",
+            "items": {"type": "array",
+                      "items": {"type": ["number", "array"]}
+                      }
+        }
+    },
+    "required": ["algorithm", "mod_0", "freqs",
+                 "mod_indices", "feedback",
+                 "output_env", "envs", "volume"
+                 ]
+}
+# built once, since jsonschema.validate also checks the schema itself
+# against its metaschema on every call
+PATCH_VALIDATOR = validator_for(PATCH_SCHEMA)(PATCH_SCHEMA)
+
 
 def envelope(a: float, d: float, s_len: float, s_level: float, r: float
              ) -> np.ndarray:
@@ -52,25 +116,26 @@ def envelope(a: float, d: float, s_len: float, s_level: float, r: float
     Returns:
         An adsr envelope as an np.array of size np.size(T)
     """
-    if s_level > 1 or s_level < 0:
+    # written so that a NaN sustain level is rejected as well
+    if not 0 <= s_level <= 1:
         raise ValueError(f"s_level {s_level} is not in the interval [0,1]")
-    a_end = np.ceil(a*FS)
-    a_int = np.linspace(0, 1, int(a_end))
-
-    d_end = np.ceil(d*FS)
-    d_int = 1 - np.linspace(0, 1-s_level, int(d_end))
-
-    s_end = np.ceil(s_len*FS)
-    s_int = s_level*np.ones(int(s_end))
-
-    r_end = np.ceil(r*FS)
-    r_int = s_level*np.linspace(1, 0, int(r_end))
-
-    adsr = np.concatenate((a_int, d_int, s_int, r_int))
-    if a + d + s_len + r > SECONDS:
-        env = np.resize(adsr, np.size(T))
-    else:
-        env = np.concatenate((adsr, np.zeros(np.size(T)-np.size(adsr))))
+    if min(a, d, s_len, r) < 0:
+        raise ValueError(f"stage lengths {(a, d, s_len, r)} must not be "
+                         "negative")
+    # each stage is written straight into the envelope, and stages
+    # past the end of T are cut off rather than computed in full
+    env = np.zeros(N_SAMPLES)
+    start = 0
+    for begin, end, length in ((0, 1, a),
+                               (1, s_level, d),
+                               (s_level, s_level, s_len),
+                               (s_level, 0, r)
+                               ):
+        n = int(np.ceil(length*FS))
+        k = min(n, N_SAMPLES - start)
+        if k > 0:
+            env[start:start+k] = _ramp(begin, end, n, k)
+            start += k
     return env
 
 
@@ -106,7 +171,7 @@ class Operator:
         """
         self._freq = freq*NOTE
         self.mod_idx = mod_idx
-        self._env = envelope(*env) if env else np.ones(np.size(T))
+        self._env = envelope(*env) if env else NO_ENVELOPE
         self.fb = fb
         self.mod = mod
         self._out = None  # output is not computed until needed
@@ -125,7 +190,7 @@ class Operator:
 
     @env.setter
     def env(self, value: list) -> None:
-        self._env = envelope(*value) if value else np.ones(np.size(T))
+        self._env = envelope(*value) if value else NO_ENVELOPE
 
     @property
     def out(self) -> np.ndarray:
@@ -133,16 +198,19 @@ class Operator:
         return self._out
 
     def _update_out(self) -> None:
+        # the carrier phase is the same for every feedback iteration,
+        # and each iteration is computed in place in a single buffer
+        phase = np.multiply(self._freq, TWO_PI_T)
+        out = np.empty_like(phase)
         fb_mod = self.mod
-        for _ in range(0, self.fb):
-            fb_mod = np.multiply(
-                self._env,
-                np.sin(2*np.pi*self._freq*T + self.mod_idx*fb_mod)
-            )
-        self._out = np.multiply(
-            self._env,
-            np.sin(2*np.pi*self._freq*T + self.mod_idx*fb_mod)
-        )
+        for _ in range(0, self.fb + 1):
+            np.multiply(self.mod_idx, fb_mod, out=out)
+            out += phase
+            np.sin(out, out=out)
+            if self._env is not NO_ENVELOPE:
+                out *= self._env
+            fb_mod = out
+        self._out = out
 
 
 class OperatorChain:
@@ -172,6 +240,10 @@ class OperatorChain:
           i.e. the result of FM synthesis.
         operators: A list of the operators in the chain,
           with smaller index being operator earlier in the chain.
+
+    The operator outputs for the last CHAIN_CACHE_SIZE sets of parameters
+    are remembered, so going back to earlier parameters, e.g. undoing
+    a change, does not recompute any operator outputs.
     """
     def __init__(self, n_ops: int, mod_0: np.ndarray, volume, op_params: tuple
                  ) -> None:
@@ -183,7 +255,7 @@ class OperatorChain:
         self.n_ops = n_ops
         self.freqs, self.mod_indices, self.envs, self.feedback = op_params
         self.mod_0 = mod_0
-        self.volume = volume
+        self._volume = volume
         operators = []
         curr_op = Operator(self.freqs[0],
                            self.mod_indices[0],
@@ -200,12 +272,30 @@ class OperatorChain:
             op = Operator(freq, mi, env, fb, curr_op.out)
             operators.append(op)
             curr_op = op
-        self._output = curr_op.out
+        self._set_output(curr_op.out)
         self.operators = operators
+        self._output_cache = OrderedDict()
+        self._cache_outputs()
 
     @property
     def output(self):
-        return np.multiply(self.volume, self._output)
+        # the output scaled by volume is computed whenever either changes,
+        # by whichever thread changes it, so reading it (e.g. from a plot
+        # on the Gtk main thread) never writes to the chain
+        return self._scaled_output
+
+    @property
+    def volume(self):
+        return self._volume
+
+    @volume.setter
+    def volume(self, value) -> None:
+        self._volume = value
+        self._scaled_output = np.multiply(value, self._output)
+
+    def _set_output(self, output: np.ndarray) -> None:
+        self._output = output
+        self._scaled_output = np.multiply(self._volume, output)
     
     def set_new_op_params(self, op_params: list[list]) -> None:
         """ Finds first operator whose parameters are being changed, then
@@ -218,9 +308,12 @@ class OperatorChain:
         Args:
             op_params: a tuple (freqs, mod_indices, envs, feedbacks)
         """
+        freqs, mod_indices, envs, feedback = op_params
+        if _chain_params_key(op_params) in self._output_cache:
+            self._restore_outputs(op_params)
+            return
         # find first operator whose parameters will change
         start_idx = self.n_ops-1
-        freqs, mod_indices, envs, feedback = op_params
         for i in range(self.n_ops-1):
             if (freqs[i], mod_indices[i], envs[i], feedback[i]) != (
                     self.freqs[i],
@@ -255,7 +348,48 @@ class OperatorChain:
             op.freq, op.mod_idx, op.env, op.fb = freq, mi, env, fb
             op.mod = curr_op.out
             curr_op = op
-        self._output = curr_op.out
+        self._set_output(curr_op.out)
+        self._cache_outputs()
+
+    def _cache_outputs(self) -> None:
+        """ Remembers the operator outputs and envelopes for the current
+        parameters, forgetting the least recently used outputs if the
+        cache is full.
+        """
+        key = _chain_params_key(
+            (self.freqs, self.mod_indices, self.envs, self.feedback)
+        )
+        self._output_cache[key] = [(op._out, op._env)
+                                   for op in self.operators]
+        self._output_cache.move_to_end(key)
+        if len(self._output_cache) > CHAIN_CACHE_SIZE:
+            self._output_cache.popitem(last=False)
+
+    def _restore_outputs(self, op_params: list[list]) -> None:
+        """ Sets the chain parameters to op_params, and the operator
+        outputs and envelopes to the remembered ones for those parameters.
+        """
+        key = _chain_params_key(op_params)
+        cached = self._output_cache[key]
+        self._output_cache.move_to_end(key)
+        freqs, mod_indices, envs, feedback = op_params
+        self.freqs[:] = freqs
+        self.mod_indices[:] = mod_indices
+        self.envs[:] = envs
+        self.feedback[:] = feedback
+        mod = self.mod_0
+        for op, freq, mi, fb, (out, env) in zip(self.operators, freqs,
+                                                mod_indices, feedback,
+                                                cached
+                                                ):
+            # the envelope is assigned directly, since the env setter
+            # would compute it again
+            op.freq, op.mod_idx, op.fb = freq, mi, fb
+            op._env = env
+            op.mod = mod
+            op._out = out
+            mod = out
+        self._set_output(mod)
 
 
 class Synth:
@@ -270,6 +404,11 @@ class Synth:
           which are lists of operators whose outputs are "chained" together.
         output: The normalised pointwise sum of the chain outputs,
           before the output envelope has been applied.
+
+    The last ENVELOPE_CACHE_SIZE output envelopes are remembered, so
+    switching the output envelope off and on again, or back to earlier
+    parameters, does not recompute the envelope. The remembered
+    envelopes are read-only, since they are shared.
     """
     def __init__(self, patch: dict) -> None:
         self.patch = patch
@@ -285,14 +424,15 @@ class Synth:
             chains.append(OperatorChain(a, m_0, v, (f, mi, e, fb)))
         self.chains = chains
         self.output = addsyn(
-            [getattr(chain, 'output') for chain in self.chains]
+            [chain.output for chain in self.chains]
         )
         
+        self._envelope_cache = OrderedDict()
         if self.patch["output_env"]:
-            self._output_envelope = envelope(*self.patch["output_env"])
+            self._output_envelope = self._envelope(self.patch["output_env"])
             self._prev_output_env_parameters = self.patch["output_env"]
         else:
-            self._output_envelope = np.ones(np.size(T))
+            self._output_envelope = NO_ENVELOPE
             self._prev_output_env_parameters = default_patch["output_env"]
             
         self._output_with_envelope = np.multiply(self.output,
@@ -301,7 +441,7 @@ class Synth:
 
     def _update_output(self) -> None:
         self.output = addsyn(
-            [getattr(chain, 'output') for chain in self.chains]
+            [chain.output for chain in self.chains]
         )
         self._output_with_envelope = np.multiply(self.output,
                                                  self._output_envelope
@@ -309,14 +449,30 @@ class Synth:
 
     def _update_output_envelope(self) -> None:
         if self.patch["output_env"]:
-            self._output_envelope = envelope(*self.patch["output_env"])
+            self._output_envelope = self._envelope(self.patch["output_env"])
             self._prev_output_env_parameters = self.patch["output_env"]
         else:
-            self._output_envelope = np.ones(np.size(T))
+            self._output_envelope = NO_ENVELOPE
         self._output_with_envelope = np.multiply(self._output_envelope,
                                                  self.output
                                                  )
 
+    def _envelope(self, env_params: list) -> np.ndarray:
+        """ Returns the read-only envelope for env_params, computing it
+        only if it is not remembered, and forgetting the least recently
+        used envelope if the cache is full.
+        """
+        key = tuple(env_params)
+        if key in self._envelope_cache:
+            self._envelope_cache.move_to_end(key)
+            return self._envelope_cache[key]
+        env = envelope(*env_params)
+        env.setflags(write=False)
+        self._envelope_cache[key] = env
+        if len(self._envelope_cache) > ENVELOPE_CACHE_SIZE:
+            self._envelope_cache.popitem(last=False)
+        return env
+
     def get_envelope_patch_param(self) -> list[float]:
         """ Gets the envelope parameter in the patch for the
             specified operator, or the output envelope by default.
@@ -355,9 +511,18 @@ class Synth:
         and updates patch to these new values
 
         Args:
-            op_params: tuple (freqs, mod_indices, envs, feedbacks)
+            op_params: tuple (freqs, mod_indices, envs, feedbacks),
+              where freqs, mod_indices and feedbacks can be lists or
+              1-d arrays. They are stored as lists, so that the patch
+              can still be saved as json.
             chain_idx: the chain being updated
         """
+        freqs, mod_indices, envs, feedback = op_params
+        op_params = (np.asarray(freqs, dtype=float).tolist(),
+                     np.asarray(mod_indices, dtype=float).tolist(),
+                     envs,
+                     np.asarray(feedback, dtype=int).tolist()
+                     )
         self.chains[chain_idx].set_new_op_params(op_params)
         param_names = ["freqs", "mod_indices", "envs", "feedback"]
         for i, param_name in enumerate(param_names):
@@ -378,10 +543,16 @@ class Synth:
         self._update_output_envelope()
         
     def play_sound(self) -> None:
-        """ Plays the sound of the synth output. """
-        with tempfile.NamedTemporaryFile(suffix='.wav') as temp:
-            sf.write(temp, self._output_with_envelope, FS)
-            os.system(f'aplay {temp.name}')
+        """ Plays the sound of the synth output. The output is piped to
+        aplay as a wav file in memory, rather than written to disk first,
+        and this blocks until aplay has finished.
+        """
+        wav = io.BytesIO()
+        sf.write(wav, self._output_with_envelope, FS, format="WAV")
+        try:
+            subprocess.run(["aplay"], input=wav.getvalue(), check=False)
+        except OSError as e:  # e.g. aplay is not installed
+            print("could not play sound: ", e)
 
     def get_envelope_plot_params(self) -> tuple[np.ndarray, np.ndarray]:
         """ Gets x and y values for the envelope plot.
@@ -413,8 +584,11 @@ class Synth:
         Args:
             patch_name: The name of the patch, which must be a string.
         """
+        # json.dumps uses the C encoder, whereas json.dump encodes the
+        # patch chunk by chunk in Python, and the file gets one write
+        patch_json = json.dumps(self.patch)
         with open(patch_name, 'w', encoding="utf-8") as f:
-            json.dump(self.patch, f)
+            f.write(patch_json)
         print("patch saved in ", patch_name)
 
 
@@ -465,8 +639,11 @@ def addsyn(waves: list[np.ndarray]) -> np.ndarray:
     Returns:
         The normalised pointwise sum of the waves in waves.
     """
-    out = np.sum(waves, 0)
-    out = out/np.max(out)
+    # summed in place into one array, rather than stacking the waves
+    out = np.array(waves[0], dtype=np.float64)
+    for wave in waves[1:]:
+        out += wave
+    out /= np.max(out)
     return out
 
 
@@ -482,61 +659,9 @@ def read_patch(patch_filename: str) -> dict:
         The patch read from the file with the name patch_filename in the
           current directory.
     """
-
-    # TODO: no. arguments based on algorithm
-    schema = {
-        "type": "object",
-        "properties": {
-            "algorithm": {
-                "type": "array",
-                "items": {"type": "number"}
-            },
-            "mod_0": {
-                "type": "array",
-                "items": {"type": "number"}
-            },
-            "volume": {
-                "type": "array",
-                "items": {"type": "number"}
-            },
-            "freqs": {
-                "type": "array",
-                "items": {"type": "array",
-                          "items": {"type": "number"}
-                          }
-            },
-            "mod_indices": {
-                "type": "array",
-                "items": {"type": "array",
-                          "items": {"type": "number"}
-                          }
-            },
-            "feedback": {
-                "type": "array",
-                "items": {"type": "array",
-                          "items": {"type": "number"}
-                          }
-            },
-            "output_env": {
-                "type": "array",
-                "items": {"type": ["number", "array"]}
-            },
-            "envs": {
-                "type": "array",
-                "items": {"type": "array",
-                          "items": {"type": ["number", "array"]}
-                          }
-            }
-        },
-        "required": ["algorithm", "mod_0", "freqs",
-                     "mod_indices", "feedback",
-                     "output_env", "envs", "volume"
-                     ]
-    }
-
     with open(patch_filename, encoding="utf-8") as f:
         patch = json.load(f)
-    validate(instance=patch, schema=schema)
+    PATCH_VALIDATOR.validate(patch)
     print(patch)
     return patch
 
@@ -552,11 +677,11 @@ def new_patch_algorithm(algorithm: list[int]) -> dict:
         A new patch with default values in
             the right form to be used by the synth.
 """
-    n_ops = int(np.sum(algorithm))
-    freqs = reshape_list([1.0]*n_ops, algorithm)
-    mod_indices = reshape_list([1.0]*n_ops, algorithm)
-    envs = reshape_list([[]]*n_ops, algorithm)
-    feedback = reshape_list([0]*n_ops, algorithm)
+    freqs = [[1.0]*n for n in algorithm]
+    mod_indices = [[1.0]*n for n in algorithm]
+    # each operator gets its own empty envelope list
+    envs = [[[] for _ in range(n)] for n in algorithm]
+    feedback = [[0]*n for n in algorithm]
     output_env = []
     mod_0 = [0]*len(algorithm)
     volume = [1.0]*len(algorithm)
@@ -574,6 +699,29 @@ def new_patch_algorithm(algorithm: list[int]) -> dict:
 
 
 # -- HELPER METHODS --
+def _chain_params_key(op_params: tuple) -> tuple:
+    """ Returns a hashable key for the operator parameters of a chain.
+
+    Args:
+        op_params: a tuple (freqs, mod_indices, envs, feedbacks)
+    """
+    freqs, mod_indices, envs, feedback = op_params
+    return (tuple(freqs),
+            tuple(mod_indices),
+            tuple(tuple(env) for env in envs),
+            tuple(feedback)
+            )
+
+
+def _ramp(begin: float, end: float, n: int, k: int) -> np.ndarray:
+    """ Returns the first k of n evenly spaced values from begin to end,
+    as np.linspace(begin, end, n)[:k] would without computing all n.
+    """
+    if n == 1:
+        return np.full(k, begin, dtype=float)
+    return begin + (end - begin)/(n - 1)*np.arange(k)
+
+
 def reshape_list(vals: list, algorithm: list[int]) -> list[list]:
     """ Reshapes a list of parameters for each operator into the correct
     format for a patch specified by algorithm.
@@ -588,18 +736,11 @@ def reshape_list(vals: list, algorithm: list[int]) -> list[list]:
           consisting of that many operators.
 
     Returns:
-        new_vals: The list vals formatted according to algorithm as above.
+        The list vals formatted according to algorithm as above.
     """
     if len(vals) != sum(algorithm):
         raise ValueError(
             f"vals {vals} not compatible with algorithm {algorithm}"
         )
-    new_vals = []
-    vals_idx = 0
-    for i in algorithm:
-        vals_mbr = []
-        for _ in range(i):
-            vals_mbr.append(vals[vals_idx])
-            vals_idx += 1
-        new_vals.append(vals_mbr)
-    return new_vals
+    ends = accumulate(algorithm)
+    return [list(vals[end-n:end]) for n, end in zip(algorithm, ends)]
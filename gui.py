@@ -15,32 +15,34 @@ FM synthesizer.
 
 import sys
 import json
+import threading
 import jsonschema
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import fm  # fm.py
 from abc import abstractmethod
 from abc import ABC
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_gtk3agg import \
-    FigureCanvasGTK3Agg as FigureCanvas  # for figures in gtk window
 from gi.repository import Gtk
+from gi.repository import GLib
 import gi
 
 gi.require_version("Gtk", "3.0")
-settings = Gtk.Settings.get_default()
-settings.set_property("gtk-theme-name", "Adwaita")
-settings.set_property("gtk-application-prefer-dark-theme", False)
 
-OUTPUT_XLIM = (0, fm.T[fm.PLOT_LIM])
+# end of the x axis of the output and chain plots
+PLOT_XMAX = float(fm.T[fm.PLOT_LIM])
+
+OUTPUT_XLIM = (0, PLOT_XMAX)
 OUTPUT_YLIM = (-1.1, 1.1)
-OUTPUT_XTICKS = (0, fm.T[fm.PLOT_LIM])
+OUTPUT_XTICKS = (0, PLOT_XMAX)
 OUTPUT_YTICKS = (-1, 1)
 OUTPUT_COLOR = 'k'
 OUTPUT_TITLE_FONTSIZE = 12
 OUTPUT_CANVAS_SIZE = (600, 300)
 
-CHAIN_XLIM = (0, fm.T[fm.PLOT_LIM])
+CHAIN_XLIM = (0, PLOT_XMAX)
 CHAIN_YLIM = (-1.1, 1.1)
-CHAIN_XTICKS = (0, fm.T[fm.PLOT_LIM])
+CHAIN_XTICKS = (0, PLOT_XMAX)
 CHAIN_YTICKS = (-1, 1)
 CHAIN_COLOR = 'k'
 CHAIN_TITLE_FONTSIZE = 10
@@ -53,37 +55,47 @@ ENV_COLOR = 'k'
 ENV_TITLE_FONTSIZE = 10
 ENV_CANVAS_SIZE = (300, 150)
 
+# fixed position [left, bottom, width, height] of the axes in each figure
+PLOT_AXES_RECT = (0.1, 0.15, 0.82, 0.7)
+
 SIDEBAR_SIZE = (50, 500)
 CHAIN_INPUT_SIZE = (600, 200)
 ENV_INPUT_SIZE = (300, 200)
 
-SPINBUTTON_DIGITS = {"freqs": 5, "mod_indices": 5, "feedback": 0}
-SPINBUTTON_ADJUSTMENT = {
-    "freqs": {
-        "value": 0,
-        "lower": 0,
-        "upper": 100,
-        "step_increment": 1,
-        "page_increment": 5,
-        "page_size": 0
-    },
-    "mod_indices": {
-        "value": 0,
-        "lower": 0,
-        "upper": 100,
-        "step_increment": 0.1,
-        "page_increment": 1,
-        "page_size": 0
-    },
-    "feedback": {
-        "value": 0,
-        "lower": 0,
-        "upper": 10,
-        "step_increment": 1,
-        "page_increment": 2,
-        "page_size": 0
-    }
+# plots with more points than this are decimated before drawing,
+# which is about two points per pixel of the widest canvas
+PLOT_MAX_POINTS = 1200
+
+# cheaper line drawing for the waveform plots
+PLOT_RCPARAMS = {
+    "path.simplify": True,
+    "path.simplify_threshold": 1.0,
+    "agg.path.chunksize": 10000,
+    "lines.antialiased": False
+}
+
+# time in ms after the last spinbutton change before parameters are applied
+DEBOUNCE_INTERVAL = 150
+
+# minimum time in ms between redraws of a plot, about one frame at 60 Hz
+PLOT_FRAME_INTERVAL = 16
+
+# row labels of the chain widget grid, from the second row down
+CHAIN_ROW_LABELS = ("Frequency", "Modulation Index", "Feedback", "Volume")
+
+# row labels of the envelope widget grid
+ENV_ROW_LABELS = ("Attack", "Decay", "Sustain", "Sustain Level", "Release")
+
+# spinbutton digits and Gtk.Adjustment.new arguments after the initial
+# value, i.e. (lower, upper, step_increment, page_increment, page_size),
+# for each chain parameter
+ParamSpec = namedtuple("ParamSpec", "digits adj_args")
+SPINBUTTON_SPECS = {
+    "freqs": ParamSpec(5, (0, 100, 1, 5, 0)),
+    "mod_indices": ParamSpec(5, (0, 100, 0.1, 1, 0)),
+    "feedback": ParamSpec(0, (0, 10, 1, 2, 0))
 }
+ENV_SPINBUTTON_SPEC = ParamSpec(4, (0, 1, 0.005, 0.1, 0))
 
 
 class AlgorithmDialog(Gtk.Dialog):
@@ -133,10 +145,105 @@ class AlgorithmDialog(Gtk.Dialog):
         return [val for val in entry_vals if val != 0]
 
 
+class SynthWorker:
+    """ Runs synth updates on a single background thread, so that the FM
+    computation does not block the Gtk main loop.
+
+    Every update which changes the synth goes through the same worker,
+    so updates are applied one at a time in the order submitted. Each
+    update has a key, and an update which has not started yet is skipped
+    if a newer update with the same key has been submitted, since the
+    newer update overwrites whatever it would have set.
+    """
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._generations = {}
+
+    def submit(self, key, on_done, fn, *args) -> None:
+        """ Runs fn(*args) on the worker thread, then on_done() in the
+        Gtk main loop, unless a newer update for key was submitted.
+
+        Args:
+            key: Identifies which part of the synth the update changes.
+            on_done: Called without arguments once the update is done,
+                e.g. to update the plots, or None.
+            fn: The function which updates the synth.
+            args: Arguments for fn.
+        """
+        generation = self._generations.get(key, 0) + 1
+        self._generations[key] = generation
+
+        def job():
+            if generation == self._generations[key]:
+                fn(*args)
+
+        def done(future):
+            GLib.idle_add(self._finish, key, generation, future, on_done)
+
+        self._executor.submit(job).add_done_callback(done)
+
+    def _finish(self, key, generation, future, on_done) -> bool:
+        future.result()  # raises any error from the worker thread here
+        if on_done is not None and generation == self._generations[key]:
+            on_done()
+        return False  # remove idle source
+
+
+class Debouncer:
+    """ Delays calls until no call with the same key has been made for
+    some time, so that a burst of calls, e.g. from holding down a
+    spinbutton, becomes a single call once the burst is over.
+    """
+    def __init__(self, interval: int):
+        """
+        Args:
+            interval: Time in ms to wait after the last call.
+        """
+        self._interval = interval
+        self._pending = {}
+
+    def __call__(self, key, fn, *args) -> None:
+        """ Calls fn(*args) once interval ms have passed without another
+        call for key, replacing any call still pending for key.
+
+        Args:
+            key: Identifies which calls replace each other.
+            fn: The function to call.
+            args: Arguments for fn.
+        """
+        self.cancel(key)
+        self._pending[key] = GLib.timeout_add(self._interval, self._fire,
+                                              key, fn, *args)
+
+    def cancel(self, key) -> None:
+        """ Drops the call pending for key, if there is one.
+
+        Args:
+            key: Identifies the call to drop.
+        """
+        source_id = self._pending.pop(key, None)
+        if source_id is not None:
+            GLib.source_remove(source_id)
+
+    def _fire(self, key, fn, *args) -> bool:
+        del self._pending[key]
+        fn(*args)
+        return False  # remove timeout source
+
+
+def _rounded(values, digits: int) -> tuple:
+    """ Returns values rounded to the digits shown in their spinbuttons,
+    for comparing with the last update, so that changes too small to see
+    do not cause an update. Only the comparison is rounded; the synth is
+    given the values as they are.
+    """
+    return tuple(round(float(val), digits) for val in values)
+
+
 class ChainWidget(Gtk.Grid):
     """ A widget containing entries for the parameters
-    for each operator in a chain, and a button to update
-    the chain's operator parameters to those new values.
+    for each operator in a chain. The chain's operator parameters
+    are updated to the new values once the entries stop changing.
 
     ChainWidget is given chain_output_plot and output_plot
     objects to update the plot when the synth is updated.
@@ -146,12 +253,15 @@ class ChainWidget(Gtk.Grid):
         chain_idx: Which chain in synth we are working with
         *_spinbuttons: List of spinbuttons for entry for
             respective operator parameters.
-        chain_output_plot: The ChainOutputPlot object corresponding
-            to chain chain_idx
+        chain_output_plot: The ChainOutputPlot object shared by
+            all chains, which shows chain chain_idx while this
+            widget is visible
         output_plot: The OutputPlot object for the main output
+        worker: The SynthWorker which applies updates to synth
     """
     def __init__(self,
                  synth: fm.Synth,
+                 worker: SynthWorker,
                  chain_output_plot,
                  output_plot,
                  chain_idx: int,
@@ -160,43 +270,63 @@ class ChainWidget(Gtk.Grid):
 
         Args:
             synth: The synth object whose chain we are working with
-            chain_ax: A reference to the chain output plot
-            chain_canvas: A reference to the canvas containing
-                the chain output plot
+            worker: The SynthWorker which applies updates to synth
+            chain_output_plot: The ChainOutputPlot shared by all chains,
+                which is updated when this chain is modified
+            output_plot: The OutputPlot for the main output, which is
+                updated when this chain is modified
             chain_idx: Index of the chain in synth we are working with
-            main_window: A reference to the main window,
-                so that when a chain is modified we can
-                ask the final output plot to update
         """
         super().__init__()
         self.synth = synth
+        self.worker = worker
         self.chain_idx = chain_idx
         self.chain_output_plot = chain_output_plot
         self.output_plot = output_plot
+        chain = self.synth.chains[chain_idx]
 
-        # set up spinbuttons and update button
-        # for entering and updating chain parameters
-        update_button = Gtk.Button(label="Update Parameters")
-        update_button.connect("clicked", self.on_update_button_clicked)
-
+        # set up spinbuttons for entering chain parameters
         def _init_chain_param_spinbuttons(param_name: str
                                           ) -> list[Gtk.SpinButton]:
             spinbuttons = []
-            initial_vals = getattr(self.synth.chains[chain_idx], param_name)
+            spec = SPINBUTTON_SPECS[param_name]
+            initial_vals = getattr(chain, param_name)
             for val in initial_vals:
                 spinbutton = Gtk.SpinButton()
-                adjustment = Gtk.Adjustment(
-                    **SPINBUTTON_ADJUSTMENT[param_name]
+                spinbutton.set_adjustment(
+                    Gtk.Adjustment.new(val, *spec.adj_args)
                 )
-                spinbutton.set_adjustment(adjustment)
-                spinbutton.set_digits(SPINBUTTON_DIGITS[param_name])
-                spinbutton.set_value(val)
+                spinbutton.set_digits(spec.digits)
                 spinbuttons.append(spinbutton)
             return spinbuttons
 
         self.freq_spinbuttons = _init_chain_param_spinbuttons("freqs")
         self.mod_idx_spinbuttons = _init_chain_param_spinbuttons("mod_indices")
         self.feedback_spinbuttons = _init_chain_param_spinbuttons("feedback")
+        # buffers holding the current spinbutton values, which are
+        # kept up to date as each spinbutton changes
+        n_ops = chain.n_ops
+        self._freqs_buf = np.empty(n_ops, dtype=np.float64)
+        self._mod_indices_buf = np.empty(n_ops, dtype=np.float64)
+        self._feedback_buf = np.empty(n_ops, dtype=np.int32)
+        # spinbutton changes are applied once they stop for
+        # DEBOUNCE_INTERVAL ms
+        self._debounce = Debouncer(DEBOUNCE_INTERVAL)
+        for spinbuttons, buf in (
+                (self.freq_spinbuttons, self._freqs_buf),
+                (self.mod_idx_spinbuttons, self._mod_indices_buf),
+                (self.feedback_spinbuttons, self._feedback_buf)
+        ):
+            for i, spinbutton in enumerate(spinbuttons):
+                buf[i] = spinbutton.get_value()
+                spinbutton.connect("value-changed", self.on_param_changed,
+                                   buf, i
+                                   )
+        # parameters last given to the synth, to skip no-op updates
+        self._last_params = self._params_key(chain.freqs,
+                                             chain.mod_indices,
+                                             chain.feedback
+                                             )
 
         volume_scale = Gtk.Scale()
         volume_adjustment = {
@@ -212,13 +342,13 @@ class ChainWidget(Gtk.Grid):
         volume_scale.set_value(self.synth.patch["volume"][self.chain_idx])
         volume_scale.connect("value-changed", self.on_volume_scale_changed)
         volume_scale.set_orientation(Gtk.Orientation.HORIZONTAL)
+        self._volume_pending = False
         
-        # spinbuttons and update button go in a grid
-        self.attach(update_button, 0, 0, 1, 1)
-        self.attach(Gtk.Label(label="Frequency"), 0, 1, 1, 1)
-        self.attach(Gtk.Label(label="Modulation Index"), 0, 2, 1, 1)
-        self.attach(Gtk.Label(label="Feedback"), 0, 3, 1, 1)
-        self.attach(Gtk.Label(label="Volume"), 0, 4, 1, 1)
+        # spinbuttons go in a grid, with child property
+        # notifications held back until everything is attached
+        self.freeze_child_notify()
+        for row, label in enumerate(CHAIN_ROW_LABELS, start=1):
+            self.attach(Gtk.Label(label=label), 0, row, 1, 1)
         for i, (freq_sb, mi_sb, fb_sb) in enumerate(zip(
                 self.freq_spinbuttons,
                 self.mod_idx_spinbuttons,
@@ -227,117 +357,314 @@ class ChainWidget(Gtk.Grid):
             self.attach(freq_sb, i+1, 1, 1, 1)
             self.attach_next_to(mi_sb, freq_sb, Gtk.PositionType.BOTTOM, 1, 1)
             self.attach_next_to(fb_sb, mi_sb, Gtk.PositionType.BOTTOM, 1, 1)
-            op_label = Gtk.Label(label=f"Operator {str(i+1)}")
+            op_label = Gtk.Label(label=f"Operator {i+1}")
             self.attach_next_to(op_label, freq_sb,
                                 Gtk.PositionType.TOP, 1, 1)
         self.attach(volume_scale, 1, 4, 2, 1)
+        self.thaw_child_notify()
         
-    def on_update_button_clicked(self, widget):
+    @staticmethod
+    def _params_key(freqs, mod_indices, feedback) -> tuple:
+        return (_rounded(freqs, SPINBUTTON_SPECS["freqs"].digits),
+                _rounded(mod_indices, SPINBUTTON_SPECS["mod_indices"].digits),
+                _rounded(feedback, SPINBUTTON_SPECS["feedback"].digits)
+                )
+
+    def _apply_params(self) -> None:
         """ Sets the synth parameters to the values in the entries
             and calls method to update chain and output plots.
+            Does nothing if the values have not changed since the
+            last update.
         """
-        freqs = [freq_sb.get_value() for freq_sb in self.freq_spinbuttons]
-        mod_indices = [mi_sb.get_value() for mi_sb in self.mod_idx_spinbuttons]
-        feedbacks = [fb_sb.get_value_as_int()
-                     for fb_sb in self.feedback_spinbuttons]
+        params = self._params_key(self._freqs_buf,
+                                  self._mod_indices_buf,
+                                  self._feedback_buf
+                                  )
+        if params == self._last_params:
+            return
+        self._last_params = params
+        # the buffers may change before the worker runs,
+        # so the worker is given copies with the same dtypes
         envs = self.synth.chains[self.chain_idx].envs
-        self.synth.set_chain_params((freqs, mod_indices, envs, feedbacks),
-                                    self.chain_idx
-                                    )
-        self.chain_output_plot.update_plot()
-        self.output_plot.update_plot()
+        self.worker.submit(("chain", self.chain_idx),
+                           self._queue_plot_updates,
+                           self.synth.set_chain_params,
+                           (self._freqs_buf.copy(),
+                            self._mod_indices_buf.copy(),
+                            envs,
+                            self._feedback_buf.copy()
+                            ),
+                           self.chain_idx
+                           )
+
+    def on_param_changed(self, spinbutton, buf, i):
+        """ Stores the new value in buf[i], and schedules the chain
+            parameters to be updated to the values in the entries, so
+            that holding a spinbutton updates the synth once,
+            DEBOUNCE_INTERVAL ms after it is released.
+        """
+        buf[i] = spinbutton.get_value()
+        self._debounce("params", self._apply_params)
 
     def on_volume_scale_changed(self, scale):
-        self.synth.set_chain_volume(scale.get_value(), self.chain_idx)
-        self.chain_output_plot.update_plot()
-        self.output_plot.update_plot()
+        """ Schedules the chain volume to be set once the main loop is
+            idle, so that dragging the scale only recomputes the output
+            once per burst of value changes.
+        """
+        if not self._volume_pending:
+            self._volume_pending = True
+            GLib.idle_add(self._apply_volume, scale)
+
+    def _apply_volume(self, scale) -> bool:
+        self._volume_pending = False
+        self.worker.submit(("volume", self.chain_idx),
+                           self._queue_plot_updates,
+                           self.synth.set_chain_volume,
+                           scale.get_value(),
+                           self.chain_idx
+                           )
+        return False  # remove idle source
+
+    def _queue_plot_updates(self) -> None:
+        self.chain_output_plot.queue_update()
+        self.output_plot.queue_update()
 
         
 class EnvelopeWidget(Gtk.Grid):
-    """ Widget with envelope parameter entries and
-        button to update output envelope to values in entries,
-        and update envelope plot.
+    """ Widget with envelope parameter entries, which updates
+        the output envelope to the values in the entries once they
+        stop changing, and updates the envelope plot.
     """
-    def __init__(self, synth, envelope_plot):
+    def __init__(self, synth, worker, envelope_plot):
         super().__init__()
         self.synth = synth
+        self.worker = worker
         self.envelope_plot = envelope_plot
 
-        # initialise envelope parameter headers
-        env_headers = []
-        env_header_labels = ["Attack", "Decay", "Sustain",
-                             "Sustain Level", "Release"]
-        for env_header_label in env_header_labels:
-            env_header = Gtk.Label(label=env_header_label)
-            env_headers.append(env_header)
-        self.update_output_env_button = Gtk.Button(
-            label="Update Output Envelope"
-        )
-        self.update_output_env_button.connect(
-            "clicked",
-            self.on_update_output_env_button_clicked
-        )
         env_params = self.synth.get_envelope_patch_param()
+        # envelope last given to the synth, to skip no-op updates
+        self._last_env = _rounded(env_params, ENV_SPINBUTTON_SPEC.digits)
+        # current spinbutton values, kept up to date as each one changes
+        self._env_buf = [0.0]*len(env_params)
         self.env_spinbuttons = []
-        for val in env_params:
+        for i, val in enumerate(env_params):
             env_sb = Gtk.SpinButton()
-            adjustment = Gtk.Adjustment(upper=1,
-                                        lower=0,
-                                        step_increment=0.005,
-                                        page_increment=0.1
-                                        )
-            env_sb.set_adjustment(adjustment)
-            env_sb.set_digits(4)
-            env_sb.set_value(val)
+            env_sb.set_adjustment(
+                Gtk.Adjustment.new(val, *ENV_SPINBUTTON_SPEC.adj_args)
+            )
+            env_sb.set_digits(ENV_SPINBUTTON_SPEC.digits)
+            self._env_buf[i] = env_sb.get_value()
+            env_sb.connect("value-changed", self.on_env_param_changed, i)
             self.env_spinbuttons.append(env_sb)
+        self._debounce = Debouncer(DEBOUNCE_INTERVAL)
 
-        self.attach(self.update_output_env_button, 0, 0, 1, 1)
-        for i, (env_sb, env_header) in enumerate(zip(self.env_spinbuttons,
-                                                     env_headers)
-                                                 ):
-            self.attach(env_header, 0, i+1, 1, 1)
-            self.attach(env_sb, 1, i+1, 1, 1)
+        self.freeze_child_notify()
+        for i, (env_sb, label) in enumerate(zip(self.env_spinbuttons,
+                                                ENV_ROW_LABELS)
+                                            ):
+            self.attach(Gtk.Label(label=label), 0, i, 1, 1)
+            self.attach(env_sb, 1, i, 1, 1)
+        self.thaw_child_notify()
 
-    def on_update_output_env_button_clicked(self, widget):
+    def _apply_output_env(self) -> None:
         """ Updates synth output envelope to values in
             the entries, and makes call to update the envelope plot.
+            Does nothing if the envelope is switched off, or if the
+            values have not changed since the last update.
         """
-        output_env = [env_sb.get_value() for env_sb in self.env_spinbuttons]
-        self.synth.set_output_envelope(output_env)
-        self.envelope_plot.update_plot()
+        if not self.get_sensitive():
+            return
+        # the synth is given a copy, since the buffer may change
+        # before the worker runs
+        output_env = list(self._env_buf)
+        env_key = _rounded(output_env, ENV_SPINBUTTON_SPEC.digits)
+        if env_key == self._last_env:
+            return
+        self._last_env = env_key
+        self.worker.submit("output_env",
+                           self.envelope_plot.queue_update,
+                           self.synth.set_output_envelope,
+                           output_env
+                           )
+
+    def on_env_param_changed(self, spinbutton, i):
+        """ Stores the new value, and schedules the output envelope to be
+            updated to the values in the entries once they stop changing
+            for DEBOUNCE_INTERVAL ms.
+        """
+        self._env_buf[i] = spinbutton.get_value()
+        self._debounce("output_env", self._apply_output_env)
 
     def activate(self, val):
-        """ Disables update button and inputs if val is False,
-            enables if True.
+        """ Disables inputs if val is False, enables if True.
+            Sensitivity is set on the whole grid, which Gtk passes on
+            to every child.
+
+            Disabling drops any envelope update still waiting to be
+            applied, so it cannot switch the envelope back on.
+            Enabling applies any values edited while that update was
+            waiting.
         """
-        self.update_output_env_button.set_sensitive(val)
-        for button in self.env_spinbuttons:
-            button.set_sensitive(val)
+        self.set_sensitive(val)
+        if val:
+            self._apply_output_env()
+        else:
+            self._debounce.cancel("output_env")
+
+
+def new_figure_canvas(size: tuple[int, int]) -> tuple:
+    """ Creates a matplotlib figure and a Gtk canvas containing it.
+
+    Matplotlib is imported here rather than at the top of the module,
+    so that the cost of importing it is only paid once the main window
+    is being built, and not before the patch dialogs are shown.
+
+    Args:
+        size: The size request (width, height) for the canvas.
+
+    Returns:
+        A tuple (fig, canvas) of the new figure and its canvas.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_gtk3agg import \
+        FigureCanvasGTK3Agg as FigureCanvas  # for figures in gtk window
+
+    fig = Figure()
+    canvas = FigureCanvas(fig)
+    canvas.set_size_request(*size)
+    return fig, canvas
+
+
+def decimate(x: np.ndarray, y: np.ndarray, max_points: int
+             ) -> tuple[np.ndarray, np.ndarray]:
+    """ Reduces a line to at most max_points points for plotting.
+
+    The points are split into at most max_points//2 buckets, and each
+    bucket is replaced by its minimum and maximum y values, placed at the
+    first and last x values of the bucket, so that the outline of a
+    waveform looks the same as when every point is drawn.
+
+    Args:
+        x: The x values of the line.
+        y: The y values of the line.
+        max_points: The maximum number of points to return.
+
+    Returns:
+        The decimated x and y values, with the same dtypes as x and y,
+        or x and y unchanged if they have no more than max_points points.
+    """
+    if np.size(y) <= max_points:
+        return x, y
+    bucket_len = -(-np.size(y) // (max_points//2))  # ceiling division
+    # the last bucket holds whatever is left over, and may be shorter
+    starts = np.arange(0, np.size(y), bucket_len)
+    ends = np.append(starts[1:], np.size(y)) - 1
+    y_dec = np.empty(2*np.size(starts), dtype=y.dtype)
+    y_dec[0::2] = np.minimum.reduceat(y, starts)
+    y_dec[1::2] = np.maximum.reduceat(y, starts)
+    x_dec = np.empty(2*np.size(starts), dtype=x.dtype)
+    x_dec[0::2] = x[starts]
+    x_dec[1::2] = x[ends]
+    return x_dec, y_dec
 
 
 class Plot(ABC):
+    """ A plot of some synth output on a Gtk canvas.
+
+    The axes decorations never change, so the plotted line is animated
+    and updated by blitting: after every full draw of the canvas (on
+    first show and on resize) the background of the axes is saved, and
+    an update only restores that background and draws the line over it.
+
+    The canvas is not drawn when a plot is constructed, since the canvas
+    is drawn anyway once Gtk allocates its size when the window is shown.
+    Full draws are only ever requested with draw_idle(), never draw(),
+    so that Gtk can coalesce them with its own expose events.
+    """
+
+    def _init_line(self, color: str) -> None:
+        """ Plots the line on self._ax and sets up blitting.
+        Subclasses call this after setting up self._canvas and self._ax.
+        """
+        (self._line,) = self._ax.plot(*self._plot_data(),
+                                      color=color,
+                                      animated=True
+                                      )
+        self._background = None
+        self._update_pending = False
+        self._canvas.mpl_connect("draw_event", self._on_draw)
+        self._canvas.mpl_connect("resize_event", self._on_resize)
+
+    def _on_draw(self, event) -> None:
+        """ Saves the axes background after a full draw and draws the
+        animated line over it, since a full draw leaves it out.
+        """
+        self._background = self._canvas.copy_from_bbox(self._ax.bbox)
+        self._ax.draw_artist(self._line)
+
+    def _on_resize(self, event) -> None:
+        """ Forgets the saved background, which no longer matches the
+        canvas, so updates fall back to a full draw until the draw
+        following the resize has saved a new one.
+        """
+        self._background = None
+
+    def queue_update(self) -> None:
+        """ Schedules update_plot for PLOT_FRAME_INTERVAL ms from now.
+        Any further calls before then are coalesced into that update,
+        so a plot is redrawn at most once per frame however often the
+        synth is updated, e.g. while the volume scale is dragged.
+        """
+        if not self._update_pending:
+            self._update_pending = True
+            GLib.timeout_add(PLOT_FRAME_INTERVAL, self._do_update)
+
+    def _do_update(self) -> bool:
+        self._update_pending = False
+        self.update_plot()
+        return False  # remove timeout source
+
+    def update_plot(self) -> None:
+        """ Redraws the line with the current plot parameters.
+        The x values of every plot are a fixed slice of fm.T, so only
+        the y values of the line are replaced.
+        """
+        _, y = self._plot_data()
+        self._line.set_ydata(y)
+        if self._background is None:  # not drawn yet
+            self._canvas.draw_idle()
+            return
+        self._canvas.restore_region(self._background)
+        self._ax.draw_artist(self._line)
+        # an unmapped canvas copies its whole buffer once it is shown
+        if self._canvas.get_mapped():
+            self._canvas.blit(self._ax.bbox)
 
     @abstractmethod
-    def update_plot(self):
+    def _get_plot_params(self) -> tuple:
         pass
 
+    def _plot_data(self) -> tuple[np.ndarray, np.ndarray]:
+        """ Returns the plot parameters decimated for drawing. """
+        return decimate(*self._get_plot_params(), PLOT_MAX_POINTS)
+
     @property
-    @abstractmethod
     def canvas(self):
-        pass
+        return self._canvas
 
 
 class ChainOutputPlot(Plot):
+    """ Plot of the output of one chain at a time. A single plot is
+    shared by all chains, and set_chain switches which chain it shows.
+    """
 
     def __init__(self, synth, chain_idx):
         self._synth = synth
         self._chain_idx = chain_idx
 
-        fig = Figure()
-        self._canvas = FigureCanvas(fig)
-        self._canvas.set_size_request(*CHAIN_CANVAS_SIZE)
+        fig, self._canvas = new_figure_canvas(CHAIN_CANVAS_SIZE)
 
-        self._ax = fig.add_subplot()
+        self._ax = fig.add_axes(PLOT_AXES_RECT)
         self._ax.set_xlim(*CHAIN_XLIM)
         self._ax.set_ylim(*CHAIN_YLIM)
         self._ax.set_xticks(CHAIN_XTICKS)
@@ -346,56 +673,41 @@ class ChainOutputPlot(Plot):
             f"Chain {chain_idx+1} Output",
             fontsize=CHAIN_TITLE_FONTSIZE
         )
+        self._init_line(CHAIN_COLOR)
 
-        plot_params = self._synth.get_chain_output_plot_params(
-            self._chain_idx
-        )
-        self._ax.plot(*plot_params, color=CHAIN_COLOR)
-        fig.set_tight_layout(True)
-        self._canvas.draw_idle()
+    def _get_plot_params(self):
+        return self._synth.get_chain_output_plot_params(self._chain_idx)
 
-    def update_plot(self):
-        self._ax.lines.clear()
-        plot_params = self._synth.get_chain_output_plot_params(
-            self._chain_idx
-        )
-        self._ax.plot(*plot_params, color=CHAIN_COLOR)
+    def set_chain(self, chain_idx: int) -> None:
+        """ Switches the plot to the output of the chain_idx-th chain. """
+        if chain_idx == self._chain_idx:
+            return
+        self._chain_idx = chain_idx
+        self._ax.set_title(f"Chain {chain_idx+1} Output",
+                           fontsize=CHAIN_TITLE_FONTSIZE
+                           )
+        _, y = self._plot_data()
+        self._line.set_ydata(y)
+        # the title is part of the saved background, so draw everything
         self._canvas.draw_idle()
 
-    @property
-    def canvas(self):
-        return self._canvas
-
 
 class EnvelopePlot(Plot):
 
     def __init__(self, synth):
         self._synth = synth
 
-        fig = Figure()
-        self._canvas = FigureCanvas(fig)
-        self._canvas.set_size_request(*ENV_CANVAS_SIZE)
+        fig, self._canvas = new_figure_canvas(ENV_CANVAS_SIZE)
 
-        self._ax = fig.add_subplot()
+        self._ax = fig.add_axes(PLOT_AXES_RECT)
         self._ax.set_xlim(*ENV_XLIM)
         self._ax.set_ylim(*ENV_YLIM)
         self._ax.set_yticks(ENV_YTICKS)
         self._ax.set_title("Output Envelope", fontsize=ENV_TITLE_FONTSIZE)
+        self._init_line(ENV_COLOR)
 
-        plot_params = self._synth.get_envelope_plot_params()
-        self._ax.plot(*plot_params, color=ENV_COLOR)
-        fig.set_tight_layout(True)
-        self._canvas.draw_idle()
-
-    def update_plot(self):
-        self._ax.lines.clear()
-        plot_params = self._synth.get_envelope_plot_params()
-        self._ax.plot(*plot_params, color=ENV_COLOR)
-        self._canvas.draw_idle()
-
-    @property
-    def canvas(self):
-        return self._canvas
+    def _get_plot_params(self):
+        return self._synth.get_envelope_plot_params()
 
 
 class OutputPlot(Plot):
@@ -403,11 +715,9 @@ class OutputPlot(Plot):
     def __init__(self, synth):
         self._synth = synth
 
-        fig = Figure()
-        self._canvas = FigureCanvas(fig)
-        self._canvas.set_size_request(*OUTPUT_CANVAS_SIZE)
+        fig, self._canvas = new_figure_canvas(OUTPUT_CANVAS_SIZE)
 
-        self._ax = fig.add_subplot()
+        self._ax = fig.add_axes(PLOT_AXES_RECT)
         self._ax.set_xlim(*OUTPUT_XLIM)
         self._ax.set_ylim(*OUTPUT_YLIM)
         self._ax.set_xticks(OUTPUT_XTICKS)
@@ -416,21 +726,10 @@ class OutputPlot(Plot):
             "Output",
             fontsize=OUTPUT_TITLE_FONTSIZE
         )
+        self._init_line(OUTPUT_COLOR)
 
-        plot_params = self._synth.get_output_plot_params()
-        self._ax.plot(*plot_params, color=OUTPUT_COLOR)
-        fig.set_tight_layout(True)
-        self._canvas.draw_idle()
-
-    def update_plot(self):
-        self._ax.lines.clear()
-        plot_params = self._synth.get_output_plot_params()
-        self._ax.plot(*plot_params, color=OUTPUT_COLOR)
-        self._canvas.draw_idle()
-
-    @property
-    def canvas(self):
-        return self._canvas
+    def _get_plot_params(self):
+        return self._synth.get_output_plot_params()
 
 
 class MainWindow(Gtk.Window):
@@ -449,12 +748,18 @@ class MainWindow(Gtk.Window):
     Attributes:
         synth: An fm.Synth object which is responsible for all synth
             computations and handling patch data
+        synth_worker: A SynthWorker which applies every update to synth
+            on a background thread, so the window stays responsive.
+        output_plot: The OutputPlot object for the main output, which
+            is given to each chain widget.
         envelope_plot: An EnvelopePlot object which updates the envelope
             plot in the envelope FigureCanvas when the envelope is toggled
             on/off.
-        chain_plot_stack: A stack containing a plot for each chain.
+        chain_output_plot: A ChainOutputPlot shared by all chains.
             When the chain stack visible child is changed to another chain,
-            the visible chain plot is changed to the respective chain.
+            the chain plot is switched to the respective chain,
+            and the chain's widget is built if this is the
+            first time the chain is shown.
     """
     def __init__(self, synth):
         """ We initialise plots for the output,
@@ -466,38 +771,41 @@ class MainWindow(Gtk.Window):
         """
 
         super().__init__(title="FM Synthesizer")
+        # set before any children are added, so the window
+        # is not first sized as a resizable window
+        self.set_resizable(False)
         self.synth = synth
+        self.synth_worker = SynthWorker()
+        # built on first save, then hidden and reused
+        self._save_dialog = None
 
         # Initialise plots, chain stack, and chain stack switcher
-        output_plot = OutputPlot(self.synth)
+        self.output_plot = OutputPlot(self.synth)
         self.envelope_plot = EnvelopePlot(self.synth)
 
         chain_stack = Gtk.Stack()
-        self.chain_plot_stack = Gtk.Stack()
+        self.chain_output_plot = ChainOutputPlot(self.synth, 0)
+        # each chain's widget is only built into its page
+        # once the chain is first selected
+        self._chain_pages = []
         for i in range(len(self.synth.patch["algorithm"])):
-            chain_output_plot = ChainOutputPlot(self.synth, i)
-            self.chain_plot_stack.add_titled(
-                chain_output_plot.canvas,
-                str(i),
-                f"Chain {i+1}"
-            )
-            chain_widget = ChainWidget(
-                self.synth,
-                chain_output_plot,
-                output_plot,
-                i
-            )
-            chain_stack.add_titled(chain_widget, str(i), f"Chain {i+1}")
+            chain_page = Gtk.Box()
+            chain_stack.add_titled(chain_page, str(i), f"Chain {i+1}")
+            self._chain_pages.append(chain_page)
+        self._build_chain_page(0)
 
         chain_stack_switcher = Gtk.StackSwitcher()
         chain_stack_switcher.set_orientation(Gtk.Orientation.VERTICAL)
         chain_stack_switcher.set_stack(chain_stack)
-        # The stack switcher can only control one stack,
-        # this is to get around that.
+        # The stack switcher only controls the chain stack,
+        # so the chain plot is switched along with it here.
         chain_stack.connect("notify::visible-child", self.switch_chain_plot)
 
         # Envelope input area
-        self.envelope_widget = EnvelopeWidget(self.synth, self.envelope_plot)
+        self.envelope_widget = EnvelopeWidget(self.synth,
+                                              self.synth_worker,
+                                              self.envelope_plot
+                                              )
         self.envelope_widget.activate(self.synth.has_output_envelope())
 
         # Initialise buttons and sidebar
@@ -526,8 +834,8 @@ class MainWindow(Gtk.Window):
 
         # Plots go in a grid
         figure_grid = Gtk.Grid()
-        figure_grid.attach(output_plot.canvas, 0, 0, 2, 4)
-        figure_grid.attach(self.chain_plot_stack, 2, 0, 2, 2)
+        figure_grid.attach(self.output_plot.canvas, 0, 0, 2, 4)
+        figure_grid.attach(self.chain_output_plot.canvas, 2, 0, 2, 2)
         figure_grid.attach(self.envelope_plot.canvas, 2, 2, 2, 2)
 
         # Finally, everything gets laid out in a grid:
@@ -550,47 +858,71 @@ class MainWindow(Gtk.Window):
         grid.attach(figure_grid_frame, 1, 2, 18, 3)
 
         self.add(grid)
-        self.set_resizable(False)
 
     def on_envelope_toggle_activated(self, togglebutton):
         if togglebutton.get_active():
-            self.synth.set_output_envelope_to_prev()
+            self.synth_worker.submit("output_env",
+                                     self.envelope_plot.queue_update,
+                                     self.synth.set_output_envelope_to_prev
+                                     )
             self.envelope_widget.activate(True)
         else:
-            self.synth.set_output_envelope([])
+            self.synth_worker.submit("output_env",
+                                     self.envelope_plot.queue_update,
+                                     self.synth.set_output_envelope,
+                                     []
+                                     )
             self.envelope_widget.activate(False)
-        self.envelope_plot.update_plot()
 
     def on_play_button_clicked(self, widget):
-        """ Plays the sound of the synth's output.
+        """ Plays the sound of the synth's output on a separate thread,
+        so the window stays responsive while the sound plays. The play
+        button is disabled until the sound has finished.
 
         Args:
             widget: Used for Gtk.Button.connect.
         """
-        self.synth.play_sound()
+        widget.set_sensitive(False)
+        threading.Thread(target=self._play, args=(widget,), daemon=True
+                         ).start()
+
+    def _play(self, play_button) -> None:
+        # runs on the play thread, so Gtk is only touched via idle_add
+        try:
+            self.synth.play_sound()
+        finally:
+            GLib.idle_add(play_button.set_sensitive, True)
 
     def on_save_button_clicked(self, widget):
         """ Runs a dialog for the user to name and select
         the location to save the current patch parameters
         in self.synth as a .json file. Then saves the file.
+
+        The dialog is hidden rather than destroyed, so later saves
+        reuse it and open in the folder last saved in.
         """
-        dialog = Gtk.FileChooserDialog(title="Save patch file as",
-                                       parent=self,
-                                       action=Gtk.FileChooserAction.SAVE
-                                       )
-        dialog.add_buttons(Gtk.STOCK_CANCEL,
-                           Gtk.ResponseType.CANCEL,
-                           Gtk.STOCK_OK,
-                           Gtk.ResponseType.OK
-                           )
+        if self._save_dialog is None:
+            self._save_dialog = Gtk.FileChooserDialog(
+                title="Save patch file as",
+                parent=self,
+                action=Gtk.FileChooserAction.SAVE
+            )
+            self._save_dialog.add_buttons(Gtk.STOCK_CANCEL,
+                                          Gtk.ResponseType.CANCEL,
+                                          Gtk.STOCK_OK,
+                                          Gtk.ResponseType.OK
+                                          )
+        dialog = self._save_dialog
         dialog.set_current_name("patch.json")
         response = dialog.run()
+        dialog.hide()
         if response == Gtk.ResponseType.OK:
+            # saved by the worker, so that the patch is not being
+            # changed by an update while it is written
             patch_filename = dialog.get_filename()
-            dialog.destroy()
-            self.synth.save_patch(patch_filename)
-        if response == Gtk.ResponseType.CANCEL:
-            dialog.destroy()
+            self.synth_worker.submit(("save", patch_filename), None,
+                                     self.synth.save_patch, patch_filename
+                                     )
 
     def on_about_button_clicked(self, widget):
         dialog = Gtk.AboutDialog()
@@ -607,11 +939,29 @@ class MainWindow(Gtk.Window):
                           chain_stack: Gtk.Stack,
                           gparamstring: str
                           ) -> None:
-        """ Sets the visible chain plot to corresponding to the chain stack
-        selected with the chain stack switcher.
+        """ Sets the chain plot to the chain corresponding to the chain
+        stack selected with the chain stack switcher.
         """
-        page_name = chain_stack.get_visible_child_name()
-        self.chain_plot_stack.set_visible_child_name(page_name)
+        chain_idx = int(chain_stack.get_visible_child_name())
+        self._build_chain_page(chain_idx)
+        self.chain_output_plot.set_chain(chain_idx)
+
+    def _build_chain_page(self, chain_idx: int) -> None:
+        """ Builds the chain widget for the chain_idx-th chain
+        into its stack page, if not already built.
+        """
+        chain_page = self._chain_pages[chain_idx]
+        if chain_page.get_children():
+            return
+        chain_widget = ChainWidget(
+            self.synth,
+            self.synth_worker,
+            self.chain_output_plot,
+            self.output_plot,
+            chain_idx
+        )
+        chain_page.pack_start(chain_widget, True, True, 0)
+        chain_page.show_all()
 
 
 def read_patch_from_file() -> dict:
@@ -676,6 +1026,11 @@ def main():
     The patch is used to initialise the Synth object which is given
     to the main window. Then we begin the Gtk.main loop.
     """
+    # the theme is only set when the programme is run,
+    # so importing this module does not load it
+    settings = Gtk.Settings.get_default()
+    settings.set_property("gtk-theme-name", "Adwaita")
+    settings.set_property("gtk-application-prefer-dark-theme", False)
 
     option_dialog = Gtk.MessageDialog(
             transient_for=None,
@@ -709,6 +1064,11 @@ def main():
     else:  # ditto
         sys.exit(0)
 
+    # like the theme, the plot settings are only changed when the
+    # programme is run, and only once the patch dialogs are done
+    import matplotlib
+    matplotlib.rcParams.update(PLOT_RCPARAMS)
+
     synth = fm.Synth(patch)
     win = MainWindow(synth)
     win.connect("destroy", Gtk.main_quit)
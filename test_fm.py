@@ -12,6 +12,11 @@
 #     GNU General Public License for more details.
 
 import unittest
+import unittest.mock
+import json
+import os
+import tempfile
+import jsonschema
 import fm
 import numpy as np
 
@@ -20,27 +25,32 @@ class TestEnvelope(unittest.TestCase):
 
     def test_typical_envelope_size(self):
         a, d, s_len, s_level, r = 0.2, 0.2, 0.2, 0.5, 0.1
-        expected = np.size(fm.T)
         self.assertEqual(
-            np.size(fm.envelope(a, d, s_len, s_level, r)),
-            expected
+            fm.envelope(a, d, s_len, s_level, r).shape,
+            fm.T.shape
         )
 
     def test_long_envelope_size(self):
         # 0.2 + 0.2 + 0.2 + SECONDS > SECONDS
         a, d, s_len, s_level, r = 0.2, 0.2, 0.2, 0.5, fm.SECONDS
-        expected = np.size(fm.T)
         self.assertEqual(
-            np.size(fm.envelope(a, d, s_len, s_level, r)),
-            expected
+            fm.envelope(a, d, s_len, s_level, r).shape,
+            fm.T.shape
         )
 
     def test_zero_envelope_size(self):
-        expected = np.size(fm.T)
-        self.assertEqual(
-            np.size(fm.envelope(0, 0, 0, 0, 0)),
-            expected
-        )
+        self.assertEqual(fm.envelope(0, 0, 0, 0, 0).shape, fm.T.shape)
+
+    def test_envelope_levels(self):
+        a, d, s_len, s_level, r = 0.1, 0.1, 0.1, 0.5, 100
+        env = fm.envelope(a, d, s_len, s_level, r)
+        a_end = int(np.ceil(a*fm.FS))
+        d_end = a_end + int(np.ceil(d*fm.FS))
+        self.assertEqual(env[0], 0)
+        self.assertAlmostEqual(env[a_end-1], 1)
+        self.assertAlmostEqual(env[d_end], s_level)
+        # release is longer than T, so it is cut off partway down
+        self.assertTrue(0 < env[-1] < s_level)
 
     def test_sus_level_out_of_bounds(self):
         a, d, s_len, r = 0.2, 0.2, 0.2, 0.1
@@ -48,6 +58,14 @@ class TestEnvelope(unittest.TestCase):
             fm.envelope(a, d, s_len, -1, r)
         with self.assertRaises(ValueError):
             fm.envelope(a, d, s_len, 2, r)
+        with self.assertRaises(ValueError):
+            fm.envelope(a, d, s_len, float("nan"), r)
+
+    def test_negative_stage_length(self):
+        with self.assertRaises(ValueError):
+            fm.envelope(-0.1, 0.2, 0.2, 0.5, 0.1)
+        with self.assertRaises(ValueError):
+            fm.envelope(0.2, 0.2, 0.2, 0.5, -0.1)
 
 
 class TestReshapeList(unittest.TestCase):
@@ -197,5 +215,138 @@ class TestNewPatchAlgorithm(unittest.TestCase):
         self.assertEqual(fm.new_patch_algorithm(alg), expected_patch)
 
 
+class TestAddsyn(unittest.TestCase):
+
+    def test_normalised_sum(self):
+        waves = [np.sin(fm.TWO_PI_T*f) for f in (440, 660, 880)]
+        expected = np.sum(waves, 0)
+        expected = expected/np.max(expected)
+        np.testing.assert_allclose(fm.addsyn(waves), expected)
+
+    def test_waves_unchanged(self):
+        waves = [np.ones(4), np.arange(4.0)]
+        fm.addsyn(waves)
+        np.testing.assert_array_equal(waves[0], np.ones(4))
+
+
+class TestReadPatch(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.patch_filename = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.patch_filename)
+
+    def test_saved_patch_read_back(self):
+        patch = fm.new_patch_algorithm([2, 1])
+        fm.Synth(patch).save_patch(self.patch_filename)
+        self.assertEqual(fm.read_patch(self.patch_filename), patch)
+
+    def test_invalid_patch_raises_error(self):
+        patch = fm.new_patch_algorithm([2, 1])
+        del patch["volume"]
+        with open(self.patch_filename, 'w', encoding="utf-8") as f:
+            json.dump(patch, f)
+        with self.assertRaises(jsonschema.ValidationError):
+            fm.read_patch(self.patch_filename)
+
+
+class TestOperatorChain(unittest.TestCase):
+
+    def setUp(self):
+        self.mod_0 = np.zeros(np.size(fm.T))
+        self.op_params = ([14.0, 1.0], [0.0, 0.5], [[], []], [0, 1])
+        self.chain = fm.OperatorChain(2, self.mod_0, 1.0,
+                                      tuple(list(p) for p in self.op_params)
+                                      )
+
+    def test_reverted_params_output(self):
+        expected = self.chain.output
+        self.chain.set_new_op_params(([2.0, 3.0], [1.0, 2.0],
+                                      [[], []], [0, 0]))
+        self.assertFalse(np.array_equal(self.chain.output, expected))
+        self.chain.set_new_op_params(self.op_params)
+        np.testing.assert_array_equal(self.chain.output, expected)
+
+    def test_update_after_revert(self):
+        new_params = ([14.0, 2.0], [0.0, 0.5], [[], []], [0, 1])
+        expected = fm.OperatorChain(2, self.mod_0, 1.0,
+                                    tuple(list(p) for p in new_params)
+                                    ).output
+        self.chain.set_new_op_params(([2.0, 3.0], [1.0, 2.0],
+                                      [[], []], [0, 0]))
+        self.chain.set_new_op_params(self.op_params)
+        self.chain.set_new_op_params(new_params)
+        np.testing.assert_array_equal(self.chain.output, expected)
+
+    def test_reverted_envelopes_reused(self):
+        env = [0.1, 0.1, 0.2, 0.5, 0.1]
+        op_params = ([14.0, 1.0], [0.0, 0.5], [env, env], [0, 1])
+        chain = fm.OperatorChain(2, self.mod_0, 1.0,
+                                 tuple(list(p) for p in op_params)
+                                 )
+        expected = [op.env for op in chain.operators]
+        chain.set_new_op_params(([2.0, 3.0], [1.0, 2.0], [[], []], [0, 0]))
+        chain.set_new_op_params(op_params)
+        for op, op_env in zip(chain.operators, expected):
+            self.assertIs(op.env, op_env)
+
+    def test_volume_scales_output(self):
+        expected = 0.5*self.chain.output
+        self.chain.volume = 0.5
+        np.testing.assert_array_equal(self.chain.output, expected)
+
+
+class TestSynth(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # the synth is built once for the whole class, so a test which
+        # changes the synth restores it when it is done
+        cls.synth = fm.Synth(fm.new_patch_algorithm([2, 2, 2]))
+
+    def test_set_chain_params_arrays(self):
+        chain = self.synth.chains[0]
+        self.addCleanup(self.synth.set_chain_params,
+                        tuple(list(p) for p in (chain.freqs,
+                                                chain.mod_indices,
+                                                chain.envs,
+                                                chain.feedback)),
+                        0)
+        envs = chain.envs
+        op_params = (np.array([2.0, 3.0]),
+                     np.array([0.5, 1.5]),
+                     envs,
+                     np.array([1, 0], dtype=np.int32)
+                     )
+        self.synth.set_chain_params(op_params, 0)
+        self.assertEqual(self.synth.patch["freqs"][0], [2.0, 3.0])
+        self.assertEqual(self.synth.patch["mod_indices"][0], [0.5, 1.5])
+        self.assertEqual(self.synth.patch["feedback"][0], [1, 0])
+        # patch must still be saveable
+        json.dumps(self.synth.patch)
+
+    def test_output_envelope_reused(self):
+        env_a = [0.1, 0.1, 0.2, 0.5, 0.1]
+        env_b = [0.2, 0.1, 0.2, 0.5, 0.1]
+        self.addCleanup(self.synth.set_output_envelope,
+                        list(self.synth.patch["output_env"]))
+        self.synth.set_output_envelope(env_a)
+        _, first = self.synth.get_envelope_plot_params()
+        self.synth.set_output_envelope(env_b)
+        self.synth.set_output_envelope([])
+        self.synth.set_output_envelope(env_a)
+        _, second = self.synth.get_envelope_plot_params()
+        self.assertIs(first, second)
+        self.assertFalse(second.flags.writeable)
+        np.testing.assert_array_equal(second, fm.envelope(*env_a))
+
+    def test_play_sound_without_aplay(self):
+        # with an empty PATH aplay cannot be found
+        with unittest.mock.patch.dict(os.environ, {"PATH": ""}):
+            self.synth.play_sound()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -12,6 +12,7 @@
 #     GNU General Public License for more details.
 
 import unittest
+import numpy as np
 import gui
 
 
@@ -21,3 +22,39 @@ class TestAlgorithmDialog(unittest.TestCase):
         dialog = gui.AlgorithmDialog()
         for entry in dialog.chain_entries:
             self.assertEqual(entry.get_value(), 2)
+
+
+class TestDecimate(unittest.TestCase):
+
+    def test_short_line_unchanged(self):
+        x = np.arange(10)
+        y = np.sin(x)
+        x_dec, y_dec = gui.decimate(x, y, 20)
+        self.assertIs(x_dec, x)
+        self.assertIs(y_dec, y)
+
+    def test_long_line_size_and_extremes(self):
+        x = np.linspace(0, 1, 44100)
+        y = np.sin(2*np.pi*50*x)
+        x_dec, y_dec = gui.decimate(x, y, 1200)
+        self.assertLessEqual(np.size(y_dec), 1200)
+        self.assertEqual(np.size(x_dec), np.size(y_dec))
+        self.assertAlmostEqual(y_dec.max(), y.max())
+        self.assertAlmostEqual(y_dec.min(), y.min())
+
+    def test_end_of_line_kept(self):
+        x = np.linspace(0, 1, 44100)
+        y = np.zeros(44100)
+        y[-1] = 2.0
+        y[-3] = -2.0
+        x_dec, y_dec = gui.decimate(x, y, 1200)
+        self.assertEqual(x_dec[-1], x[-1])
+        self.assertEqual(y_dec.max(), 2.0)
+        self.assertEqual(y_dec.min(), -2.0)
+
+    def test_dtype_preserved(self):
+        x = np.linspace(0, 1, 44100, dtype=np.float32)
+        y = np.sin(2*np.pi*50*x)
+        x_dec, y_dec = gui.decimate(x, y, 1200)
+        self.assertEqual(x_dec.dtype, np.float32)
+        self.assertEqual(y_dec.dtype, np.float32)